@@ -3,7 +3,11 @@ from comfy_api.latest import ComfyExtension, io
 
 from .client import Client
 from .completions import ChatCompletion
-from .options import OptionSeed, OptionTemperature, OptionMaxTokens, OptionTopP, OptionFrequencyPenalty, OptionPresencePenalty, OptionExtraBody, OptionDeveloperRole
+from .embeddings import Embeddings, EmbeddingsDedup, EmbeddingsSearch
+from .captioning import DatasetCaptioning
+from .warmup import PrefixWarmup
+from .history import SaveHistory, LoadHistory
+from .options import OptionSeed, OptionTemperature, OptionMaxTokens, OptionTopP, OptionFrequencyPenalty, OptionPresencePenalty, OptionExtraBody, OptionDeveloperRole, OptionImageDetail, OptionBackend, OptionStructuredOutput, OptionProfile
 
 
 class OpenAIAPIExtension(ComfyExtension):
@@ -12,6 +16,13 @@ class OpenAIAPIExtension(ComfyExtension):
         return [
             Client,
             ChatCompletion,
+            Embeddings,
+            EmbeddingsDedup,
+            EmbeddingsSearch,
+            DatasetCaptioning,
+            PrefixWarmup,
+            SaveHistory,
+            LoadHistory,
             OptionSeed,
             OptionTemperature,
             OptionMaxTokens,
@@ -19,6 +30,10 @@ class OpenAIAPIExtension(ComfyExtension):
             OptionFrequencyPenalty,
             OptionPresencePenalty,
             OptionDeveloperRole,
+            OptionImageDetail,
+            OptionBackend,
+            OptionStructuredOutput,
+            OptionProfile,
             OptionExtraBody
         ]
 
@@ -0,0 +1,76 @@
+"""Measure the extension contribution to the ComfyUI startup time.
+
+ComfyUI has already loaded comfy_api, torch, numpy and Pillow when it imports custom nodes, so they
+are preloaded before the measure: only the time (and the modules) added by the extension are reported.
+
+Usage: python benchmarks/import_time.py [--comfyui /path/to/ComfyUI] [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Modules that must only be loaded on first execution, not while registering the nodes
+LAZY_MODULES = ["openai", "httpx"]
+
+PROBE = """
+import asyncio, importlib, json, sys, time
+sys.path[:0] = [{comfyui!r}, {custom_nodes!r}]
+import comfy_api.latest
+for preload in {preload!r}:
+    try:
+        importlib.import_module(preload)
+    except ImportError:
+        pass
+before = set(sys.modules)
+start = time.perf_counter()
+extension = importlib.import_module({package!r})
+asyncio.run(asyncio.run(extension.comfy_entrypoint()).get_node_list())
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(set(sys.modules) - before)}}))
+"""
+
+
+def measure(comfyui: str, preload: list[str]) -> dict:
+    extension_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    probe = PROBE.format(
+        comfyui=comfyui,
+        custom_nodes=os.path.dirname(extension_dir),
+        preload=preload,
+        package=os.path.basename(extension_dir),
+    )
+    # Each run needs a fresh interpreter, otherwise modules would already be cached
+    result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main() -> int:
+    extension_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--comfyui", default=os.path.dirname(os.path.dirname(extension_dir)),
+                        help="ComfyUI root directory (default: the parent of the custom_nodes directory)")
+    parser.add_argument("--runs", type=int, default=5, help="number of fresh interpreters to measure")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="do not preload torch, numpy and Pillow (measure a cold interpreter)")
+    args = parser.parse_args()
+
+    preload = [] if args.no_preload else ["torch", "numpy", "PIL.Image"]
+    runs = [measure(args.comfyui, preload) for _ in range(args.runs)]
+    timings = [run["seconds"] * 1000 for run in runs]
+    modules = runs[-1]["modules"]
+    print(f"import + get_node_list: median {statistics.median(timings):.1f} ms "
+          f"(min {min(timings):.1f} ms, max {max(timings):.1f} ms, {args.runs} runs)")
+    print(f"modules loaded by the extension: {len(modules)}")
+    # Fail if a heavy dependency is imported at startup again
+    leaked = [name for name in modules if name.split(".")[0] in LAZY_MODULES]
+    if leaked:
+        print(f"eagerly imported heavy modules: {', '.join(sorted({name.split('.')[0] for name in leaked}))}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
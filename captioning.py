@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import glob
+import json
+import os
+import time
+from typing import TYPE_CHECKING, Iterator
+
+from comfy_api.latest import io
+
+from .completions import IMAGE_MIME_TYPES, bytes_to_base64_url, image_url_part, pil_image_to_base64_url, resize_image
+from .iotypes import ParamClient, ParamOptions, OptionsPayload
+from .request import EMPTY_TEMPLATE, RequestTemplate
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+
+
+def iter_image_paths(source: str) -> Iterator[str]:
+    # Lazily walk the dataset: a directory (recursively) or a glob pattern
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+    else:
+        for path in glob.iglob(source, recursive=True):
+            if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path):
+                yield path
+
+
+def encode_image_file(path: str, detail: str | None, max_tokens: int, image_format: str) -> str:
+    from PIL import Image
+    with Image.open(path) as img:
+        original_format, original_size = img.format, img.size
+        resized = resize_image(img, detail, max_tokens)
+        if resized.size == original_size and original_format in IMAGE_MIME_TYPES:
+            # No resize needed: send the original file, already compressed, instead of re-encoding it
+            with open(path, "rb") as f:
+                return bytes_to_base64_url(f.read(), IMAGE_MIME_TYPES[original_format])
+        return pil_image_to_base64_url(resized.convert("RGB"), image_format)
+
+
+class CaptionSink:
+    """Writes the captions as they come and keeps track of the finished images to resume a run."""
+
+    def __init__(self, output_format: str, output_path: str) -> None:
+        self.output_format = output_format
+        self.checkpoint_path = f"{output_path}.checkpoint"
+        self.done: set[str] = set()
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                self.done = {line.rstrip("\n") for line in f if line.strip()}
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        self.jsonl = open(output_path, "a", encoding="utf-8") if output_format == "jsonl" else None
+        self.checkpoint = open(self.checkpoint_path, "a", encoding="utf-8")
+
+    def write(self, path: str, caption: str) -> None:
+        if self.jsonl is not None:
+            self.jsonl.write(json.dumps({"image": path, "caption": caption}, ensure_ascii=False) + "\n")
+            self.jsonl.flush()
+        else:
+            with open(f"{os.path.splitext(path)[0]}.txt", "w", encoding="utf-8") as f:
+                f.write(caption)
+        # Only checkpoint once the caption is safely written
+        self.checkpoint.write(path + "\n")
+        self.checkpoint.flush()
+        self.done.add(path)
+
+    def close(self) -> None:
+        if self.jsonl is not None:
+            self.jsonl.close()
+        self.checkpoint.close()
+
+
+class DatasetCaptioning(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_DatasetCaptioning",
+            display_name="OpenAI API - Dataset Captioning",
+            category="OpenAI API",
+            description="Captions every image of a directory (or glob pattern) with a Vision Language Model. Images are streamed from disk and requests are sent concurrently, captions are written as they come and an interrupted run resumes where it stopped.",
+            inputs=[
+                ParamClient.Input(
+                    id="client",
+                    display_name="API Client",
+                    tooltip="The OpenAI API client to use to perform the requests"
+                ),
+                io.String.Input(
+                    id="model",
+                    display_name="Model",
+                    tooltip="The vision language model to use for captioning",
+                    placeholder="Model name",
+                ),
+                io.String.Input(
+                    id="source",
+                    display_name="Images",
+                    tooltip="A directory (scanned recursively) or a glob pattern like /data/**/*.png",
+                    placeholder="/path/to/images",
+                ),
+                io.String.Input(
+                    id="prompt",
+                    display_name="Prompt",
+                    tooltip="The prompt sent along with each image",
+                    multiline=True,
+                    default="Describe this image in one detailed paragraph.",
+                ),
+                io.Combo.Input(
+                    id="output_format",
+                    display_name="Output Format",
+                    tooltip="'jsonl' appends one {image, caption} line per image to the output file, 'txt' writes a caption file next to each image",
+                    options=["jsonl", "txt"],
+                    default="jsonl",
+                ),
+                io.String.Input(
+                    id="output_path",
+                    display_name="Output Path",
+                    tooltip="The JSONL file (also used as the checkpoint file prefix for the txt format), defaults to captions.jsonl in the images directory",
+                    optional=True,
+                    placeholder="/path/to/captions.jsonl",
+                ),
+                io.Int.Input(
+                    id="concurrency",
+                    display_name="Concurrency",
+                    tooltip="Maximum number of requests in flight",
+                    default=8,
+                    min=1,
+                    max=256,
+                ),
+                io.Int.Input(
+                    id="workers",
+                    display_name="Encoding Workers",
+                    tooltip="Number of threads decoding, resizing and encoding the images",
+                    default=4,
+                    min=1,
+                    max=64,
+                ),
+                io.Combo.Input(
+                    id="image_format",
+                    display_name="Image Format",
+                    tooltip="The format of the resized (or unsupported format) images, the other images are sent as is",
+                    options=["JPEG", "WEBP", "PNG"],
+                    default="JPEG",
+                ),
+                io.String.Input(
+                    id="system_prompt",
+                    display_name="System Prompt",
+                    optional=True,
+                    tooltip="The system prompt to send along with each image",
+                    multiline=True,
+                    placeholder="system/developer prompt is optional",
+                ),
+                ParamOptions.Input(
+                    id="options",
+                    display_name="Options",
+                    optional=True,
+                    tooltip="Additional options to pass with the requests",
+                ),
+            ],
+            outputs=[
+                io.String.Output(
+                    id="summary",
+                    display_name="Summary",
+                    tooltip="Number of captioned, skipped (already done) and failed images",
+                ),
+                io.String.Output(
+                    id="output_path",
+                    display_name="Output Path",
+                    tooltip="The JSONL file the captions were written to, or the checkpoint file listing the captioned images with the txt format",
+                ),
+            ],
+        )
+
+    @classmethod
+    def validate_inputs(cls, model: str, source: str) -> bool | str:
+        if model == "":
+            return "model must be specified"
+        if source == "":
+            return "images directory or glob pattern must be specified"
+        return True
+
+    @classmethod
+    def fingerprint_inputs(cls, **kwargs) -> str:
+        # Always run: the dataset may have changed and finished images are skipped anyway
+        return str(time.time())
+
+    @classmethod
+    def execute(cls,
+                client: OpenAI,
+                model: str,
+                source: str,
+                prompt: str,
+                output_format: str,
+                concurrency: int,
+                workers: int,
+                image_format: str,
+                output_path: str | None = None,
+                system_prompt: str | None = None,
+                options: OptionsPayload | None = None,
+                ) -> io.NodeOutput:
+        import comfy.model_management
+        template = options.get_template() if options is not None else EMPTY_TEMPLATE
+        if not output_path:
+            base = source if os.path.isdir(source) else os.path.dirname(source.split("*")[0]) or "."
+            output_path = os.path.join(base, "captions.jsonl")
+        sink = CaptionSink(output_format, output_path)
+        captioned, skipped, failed = 0, 0, 0
+        # Images are encoded ahead by the workers while the requests are in flight. Bound the number of
+        # images in memory: encoding + encoded waiting for a requester + in flight requests
+        max_pending = 2 * (concurrency + workers)
+        pending: dict[Future[str], tuple[str, bool]] = {}  # future: (path, is the caption request)
+        encoders = ThreadPoolExecutor(max_workers=workers)
+        requesters = ThreadPoolExecutor(max_workers=concurrency)
+
+        def collect(timeout: float | None) -> None:
+            nonlocal captioned, failed
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, requested = pending.pop(future)
+                try:
+                    if not requested:
+                        # Image encoded: send it
+                        request = requesters.submit(caption_image, client, template, model, prompt,
+                                                    system_prompt, future.result())
+                        pending[request] = (path, True)
+                        continue
+                    sink.write(path, future.result())
+                    captioned += 1
+                except Exception as e:
+                    # Not checkpointed: it will be retried by the next run
+                    print(f"Dataset captioning: failed to caption {path}: {e}")
+                    failed += 1
+                if (captioned + failed) % 100 == 0:
+                    print(f"Dataset captioning: {captioned} captioned, {failed} failed, {skipped} skipped")
+
+        try:
+            for path in iter_image_paths(source):
+                if path in sink.done:
+                    skipped += 1
+                    continue
+                while len(pending) >= max_pending:
+                    comfy.model_management.throw_exception_if_processing_interrupted()
+                    collect(timeout=1.0)
+                encode = encoders.submit(encode_image_file, path, template.image_detail, template.image_max_tokens,
+                                         image_format)
+                pending[encode] = (path, False)
+                collect(timeout=0)
+            while pending:
+                comfy.model_management.throw_exception_if_processing_interrupted()
+                collect(timeout=1.0)
+        finally:
+            # Do not wait for the requests in flight on interruption (up to the client deadline): their
+            # images are not checkpointed and will be captioned by the next run
+            encoders.shutdown(wait=False, cancel_futures=True)
+            requesters.shutdown(wait=False, cancel_futures=True)
+            sink.close()
+        summary = f"{captioned} captioned, {skipped} skipped (already done), {failed} failed"
+        print(f"Dataset captioning: {summary}")
+        return io.NodeOutput(summary, output_path if output_format == "jsonl" else sink.checkpoint_path)
+
+
+def caption_image(client: OpenAI,
+                  template: RequestTemplate,
+                  model: str,
+                  prompt: str,
+                  system_prompt: str | None,
+                  url: str,
+                  ) -> str:
+    messages: list[ChatCompletionMessageParam] = []
+    if system_prompt:
+        messages.append({
+            "role": "developer" if template.use_developer_role else "system",
+            "content": system_prompt,
+        })  # type: ignore
+    messages.append({
+        "role": "user",
+        "content": [
+            image_url_part(url, template.image_detail),
+            {
+                "type": "text",
+                "text": prompt
+            },
+        ],
+    })
+    completion = client.chat.completions.create(**template.build(model, messages))
+    return completion.choices[0].message.content or ""
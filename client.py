@@ -1,8 +1,8 @@
 from urllib.parse import urlparse
 
-from openai import OpenAI
 from comfy_api.latest import io
 
+from . import tracing
 from .iotypes import ParamClient
 
 
@@ -25,14 +25,14 @@ class Client(io.ComfyNode):
                 io.Int.Input(
                     id="max_retries",
                     display_name="Max Retries",
-                    tooltip="Max number of retries for failed requests",
+                    tooltip="Max number of retries for failed requests. Only failures where the server did not process the request are retried (connection errors, 408, 429, 502, 503, 504), with a jittered exponential backoff honoring Retry-After",
                     default=2,
                     min=0,
                 ),
                 io.Int.Input(
                     id="timeout",
-                    display_name="Timeout",
-                    tooltip="Request timeout in seconds",
+                    display_name="Deadline",
+                    tooltip="Overall time limit of a request in seconds, shared by all its attempts: no retry is attempted if it can not complete in time",
                     default=600,
                     min=1,
                 ),
@@ -44,6 +44,30 @@ class Client(io.ComfyNode):
                     placeholder="Leave the '-' placeholder if no key is needed",
                     default="-"
                 ),
+                io.Float.Input(
+                    id="connect_timeout",
+                    display_name="Connect Timeout",
+                    tooltip="Time limit in seconds to connect to the server, so a dead host fails (and is retried) fast",
+                    default=10.0,
+                    min=0.1,
+                    step=0.1,
+                ),
+                io.Float.Input(
+                    id="first_token_timeout",
+                    display_name="First Token Timeout",
+                    tooltip="Time limit in seconds for the server to start answering once the request is sent. Without streaming the whole response is generated before the server answers.",
+                    default=600.0,
+                    min=0.1,
+                    step=1.0,
+                ),
+                io.Float.Input(
+                    id="read_timeout",
+                    display_name="Read Timeout",
+                    tooltip="Time limit in seconds between two chunks of data once the server started answering (and to send the request)",
+                    default=60.0,
+                    min=0.1,
+                    step=1.0,
+                ),
             ],
             outputs=[
                 ParamClient.Output(
@@ -67,12 +91,45 @@ class Client(io.ComfyNode):
         return True
 
     @classmethod
-    def execute(cls, base_url: str, max_retries: int, timeout: int, api_key: str | None = None) -> io.NodeOutput:
+    def execute(cls,
+                base_url: str,
+                max_retries: int,
+                timeout: int,
+                api_key: str | None = None,
+                connect_timeout: float = 10.0,
+                first_token_timeout: float = 600.0,
+                read_timeout: float = 60.0,
+                ) -> io.NodeOutput:
+        # openai and httpx are heavy to import, only load them when a client is actually needed
+        import httpx
+        from openai import OpenAI, DefaultHttpxClient
+        from .transport import RetryTransport, TracingTransport
+        # Same connection limits as the openai package default client
+        transport: httpx.BaseTransport = httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=100)
+        )
+        if tracing.ENABLED:
+            transport = TracingTransport(transport)
+        transport = RetryTransport(
+            transport,
+            max_retries=max_retries,
+            deadline=timeout,
+            connect_timeout=connect_timeout,
+            first_token_timeout=first_token_timeout,
+            read_timeout=read_timeout,
+        )
         return io.NodeOutput(
             OpenAI(
                 api_key=api_key,
                 base_url=base_url,
-                max_retries=max_retries,
-                timeout=timeout
+                # Retries are handled by the transport, within the request deadline
+                max_retries=0,
+                timeout=httpx.Timeout(
+                    connect=connect_timeout,
+                    read=first_token_timeout,
+                    write=read_timeout,
+                    pool=connect_timeout,
+                ),
+                http_client=DefaultHttpxClient(transport=transport),
             )
         )
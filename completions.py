@@ -1,32 +1,118 @@
+from __future__ import annotations
+
 import base64
 from io import BytesIO
 import json
+import math
 import time
-from typing import Any
-
-import torch
-import numpy as np
-from PIL import Image
-from openai import OpenAI
-from openai.types.completion_usage import CompletionUsage
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
-from openai.types.chat.chat_completion_content_part_param import ChatCompletionContentPartParam
+from typing import TYPE_CHECKING, Any
 
 from comfy_api.latest import io, ui
 
 from .iotypes import ParamClient, ParamHistory, ParamOptions, HistoryPayload, OptionsPayload
+from .request import EMPTY_TEMPLATE, RequestTemplate
+from .structured import IncrementalJSONParser, check_schema
+from .tracing import profile, span
+
+# Heavy dependencies are only imported for type checking here, at runtime they are loaded on first use
+if TYPE_CHECKING:
+    import torch
+    from PIL import Image
+    from openai import OpenAI
+    from openai.types.completion_usage import CompletionUsage
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+    from openai.types.chat.chat_completion_content_part_param import ChatCompletionContentPartParam
+    from openai.types.chat.chat_completion_content_part_image_param import ImageURL
+
+
+# Image token accounting used by OpenAI (and mimicked by several VLM servers) for high detail images
+IMAGE_TILE_SIZE = 512
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+# Image formats accepted by the chat completions API (besides non animated GIF)
+IMAGE_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
 
 
-def comfy_image_to_base64_png_url(image: torch.Tensor) -> str:
+def image_tokens(width: int, height: int) -> int:
+    tiles = math.ceil(width / IMAGE_TILE_SIZE) * math.ceil(height / IMAGE_TILE_SIZE)
+    return IMAGE_BASE_TOKENS + tiles * IMAGE_TILE_TOKENS
+
+
+def fit_image_to_token_budget(img: Image.Image, max_tokens: int) -> Image.Image:
+    from PIL import Image
+    width, height = img.size
+    if image_tokens(width, height) <= max_tokens:
+        return img
+    # Find the tile grid (columns x rows) within the budget that keeps the most resolution
+    max_tiles = max(1, (max_tokens - IMAGE_BASE_TOKENS) // IMAGE_TILE_TOKENS)
+    scale = 0.0
+    for columns in range(1, max_tiles + 1):
+        rows = max_tiles // columns
+        scale = max(scale, min(columns * IMAGE_TILE_SIZE / width, rows * IMAGE_TILE_SIZE / height))
+    # Never upscale, floor the dimensions so they stay within the selected grid
+    scale = min(scale, 1.0)
+    size = (max(1, math.floor(width * scale)), max(1, math.floor(height * scale)))
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+
+def comfy_image_to_base64_png_url(image: torch.Tensor, detail: str | None = None, max_tokens: int = 0) -> str:
+    import numpy as np
+    from PIL import Image
     # Taken from the SaveImage ComfyUI node, convert the tensor into a regular image
-    i = np.multiply(255., image.cpu().numpy())
-    img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
-    # Encode the image as PNG in base64 format
-    buffer = BytesIO()
-    img.save(buffer, format="PNG")
-    b64_png = base64.b64encode(buffer.getvalue())
+    with span("image.convert"):
+        i = np.multiply(255., image.cpu().numpy())
+        img = Image.fromarray(np.clip(i, 0, 255).astype(np.uint8))
+    return pil_image_to_base64_png_url(img, detail, max_tokens)
+
+
+def resize_image(img: Image.Image, detail: str | None = None, max_tokens: int = 0) -> Image.Image:
+    from PIL import Image
+    # Do not send more pixels than the server will actually use
+    with span("image.resize", detail=detail, max_tokens=max_tokens) as attributes:
+        if detail == "low":
+            img.thumbnail((IMAGE_TILE_SIZE, IMAGE_TILE_SIZE), Image.Resampling.LANCZOS)
+        elif max_tokens > 0:
+            img = fit_image_to_token_budget(img, max_tokens)
+        attributes["size"] = img.size
+    return img
+
+
+def pil_image_to_base64_url(img: Image.Image, image_format: str = "PNG") -> str:
+    # Encode the image in base64 format, lossy formats keep a high quality
+    with span("image.encode", format=image_format) as attributes:
+        buffer = BytesIO()
+        img.save(buffer, format=image_format, **({} if image_format == "PNG" else {"quality": 90}))
+        attributes["bytes"] = buffer.tell()
+    return bytes_to_base64_url(buffer.getvalue(), IMAGE_MIME_TYPES[image_format])
+
+
+def bytes_to_base64_url(data: bytes, mime_type: str) -> str:
+    with span("image.base64"):
+        b64 = base64.b64encode(data)
     # Return the formated string URL
-    return f"data:image/png;base64,{b64_png.decode('utf-8')}"
+    return f"data:{mime_type};base64,{b64.decode('utf-8')}"
+
+
+def pil_image_to_base64_png_url(img: Image.Image, detail: str | None = None, max_tokens: int = 0) -> str:
+    return pil_image_to_base64_url(resize_image(img, detail, max_tokens), "PNG")
+
+
+def image_url_part(url: str, detail: str | None = None) -> ChatCompletionContentPartParam:
+    image_url: ImageURL = {
+        "url": url
+    }
+    if detail is not None:
+        image_url["detail"] = detail  # type: ignore
+    return {
+        "type": "image_url",
+        "image_url": image_url
+    }
+
+
+def cached_tokens(usage: CompletionUsage | None) -> int:
+    if usage is None or usage.prompt_tokens_details is None:
+        return 0
+    return usage.prompt_tokens_details.cached_tokens or 0
 
 
 def format_usage(usage: CompletionUsage | None) -> str | None:
@@ -87,6 +173,88 @@ def format_usage(usage: CompletionUsage | None) -> str | None:
     return text
 
 
+def prepare_messages(system_prompt: str | None,
+                     history: HistoryPayload | None,
+                     use_developer_role: bool,
+                     ) -> list[ChatCompletionMessageParam]:
+    if history is not None:
+        messages = history.get_msgs_copy()
+        if system_prompt is not None and system_prompt != "":
+            # Should we insert it at the beginning or replace the existing system message?
+            first_msg_role = messages[0].get('role')
+            if first_msg_role == "system" or first_msg_role == "developer":
+                # Replace the existing system message
+                if use_developer_role:
+                    messages[0] = {
+                        "role": "developer",  # need literal for type hint check
+                        "content": system_prompt,
+                    }
+                else:
+                    messages[0] = {
+                        "role": "system",  # need literal for type hint check
+                        "content": system_prompt,
+                    }
+            else:
+                # insert a new system/dev message at the begining of the list
+                if use_developer_role:
+                    messages.insert(0, {
+                        "role": "developer",  # need literal for type hint check
+                        "content": system_prompt,
+                    })
+                else:
+                    messages.insert(0, {
+                        "role": "system",  # need literal for type hint check
+                        "content": system_prompt,
+                    })
+    else:
+        messages: list[ChatCompletionMessageParam] = []
+        if system_prompt:
+            if use_developer_role:
+                messages.append({
+                    "role": "developer",  # need literal for type hint check
+                    "content": system_prompt,
+                })
+            else:
+                messages.append({
+                    "role": "system",  # need literal for type hint check
+                    "content": system_prompt,
+                })
+    return messages
+
+
+def create_structured_completion(client: OpenAI,
+                                 template: RequestTemplate,
+                                 model: str,
+                                 messages: list[ChatCompletionMessageParam],
+                                 ) -> tuple[str, CompletionUsage | None, Any]:
+    # Stream the response to validate the JSON document while it is generated
+    parser = IncrementalJSONParser()
+    usage = None
+    stream = client.chat.completions.create(
+        **template.build(model, messages),
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    with stream:
+        for chunk in stream:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            try:
+                parser.feed(chunk.choices[0].delta.content)
+            except ValueError as e:
+                # Leaving the context manager closes the connection, stopping the generation
+                raise ValueError(f"structured output is not a valid JSON document, generation aborted: {e}") from e
+    content = parser.text
+    try:
+        parsed = parser.close()
+        check_schema(parsed, template.json_schema or {})
+    except ValueError as e:
+        raise ValueError(f"structured output is not valid: {e}\n{content}") from e
+    return content, usage, parsed
+
+
 class ChatCompletion(io.ComfyNode):
     @classmethod
     def define_schema(cls) -> io.Schema:
@@ -158,6 +326,11 @@ class ChatCompletion(io.ComfyNode):
                     display_name="History",
                     tooltip="Conversation history",
                 ),
+                io.AnyType.Output(
+                    id="json",
+                    display_name="JSON",
+                    tooltip="The decoded response when a structured output option is set, None otherwise",
+                ),
             ],
         )
 
@@ -191,141 +364,86 @@ class ChatCompletion(io.ComfyNode):
                 force_regen: bool = False,
                 ) -> io.NodeOutput:
         # Handle options
-        seed: int | None = None
-        temperature: float | None = None
-        max_tokens: int | None = None
-        top_p: float | None = None
-        frequency_penalty: float | None = None
-        presence_penalty: float | None = None
-        use_developer_role: bool = False
-        extra_body: dict[str, Any] = {}
-        if options is not None:
-            extra_body = options.get_options_copy()
-            if "seed" in extra_body:
-                seed = extra_body["seed"]
-                del extra_body["seed"]
-            if "temperature" in extra_body:
-                temperature = extra_body["temperature"]
-                del extra_body["temperature"]
-            if "max_tokens" in extra_body:
-                max_tokens = extra_body["max_tokens"]
-                del extra_body["max_tokens"]
-            if "top_p" in extra_body:
-                top_p = extra_body["top_p"]
-                del extra_body["top_p"]
-            if "frequency_penalty" in extra_body:
-                frequency_penalty = extra_body["frequency_penalty"]
-                del extra_body["frequency_penalty"]
-            if "presence_penalty" in extra_body:
-                presence_penalty = extra_body["presence_penalty"]
-                del extra_body["presence_penalty"]
-            if "use_developer_role" in extra_body:
-                use_developer_role = extra_body["use_developer_role"]
-                del extra_body["use_developer_role"]
-        # Handle system prompt
-        if history is not None:
-            messages = history.get_msgs_copy()
-            if system_prompt is not None and system_prompt != "":
-                # Should we insert it at the beginning or replace the existing system message?
-                first_msg_role = messages[0].get('role')
-                if first_msg_role == "system" or first_msg_role == "developer":
-                    # Replace the existing system message
-                    if use_developer_role:
-                        messages[0] = {
-                            "role": "developer",  # need literal for type hint check
-                            "content": system_prompt,
-                        }
-                    else:
-                        messages[0] = {
-                            "role": "system",  # need literal for type hint check
-                            "content": system_prompt,
-                        }
-                else:
-                    # insert a new system/dev message at the begining of the list
-                    if use_developer_role:
-                        messages.insert(0, {
-                            "role": "developer",  # need literal for type hint check
-                            "content": system_prompt,
-                        })
-                    else:
-                        messages.insert(0, {
-                            "role": "system",  # need literal for type hint check
-                            "content": system_prompt,
-                        })
+        template = options.get_template() if options is not None else EMPTY_TEMPLATE
+
+        def complete() -> tuple[str, list[ChatCompletionMessageParam], Any, str | None]:
+            with span("ChatCompletion.execute", model=model):
+                return cls.complete(client, template, model, prompt, system_prompt, history, images)
+
+        if template.profile:
+            (content, messages, parsed, stats), profile_summary = profile(complete)
+            stats = f"{stats}\n\n{profile_summary}" if stats else profile_summary
         else:
-            messages: list[ChatCompletionMessageParam] = []
-            if system_prompt:
-                if use_developer_role:
-                    messages.append({
-                        "role": "developer",  # need literal for type hint check
-                        "content": system_prompt,
-                    })
-                else:
-                    messages.append({
-                        "role": "system",  # need literal for type hint check
-                        "content": system_prompt,
-                    })
+            content, messages, parsed, stats = complete()
+        # add it to the console following the openai http call log for now as previewtext does not work yet
+        print(stats)
+        # Return the response and the history and the stats for the UI
+        return io.NodeOutput(
+            content,
+            HistoryPayload(messages),
+            parsed,
+            ui=ui.PreviewText(stats) if stats else ui.PreviewText(""),
+        )
+
+    @classmethod
+    def complete(cls,
+                 client: OpenAI,
+                 template: RequestTemplate,
+                 model: str,
+                 prompt: str,
+                 system_prompt: str | None,
+                 history: HistoryPayload | None,
+                 images: list[torch.Tensor] | None,
+                 ) -> tuple[str, list[ChatCompletionMessageParam], Any, str | None]:
+        use_developer_role = template.use_developer_role
+        image_detail = template.image_detail
+        image_max_tokens = template.image_max_tokens
+        # Handle system prompt
+        with span("history", messages=len(history.history or []) if history is not None else 0):
+            messages = prepare_messages(system_prompt, history, use_developer_role)
         # Handle user message
-        if images is not None:
-            # Build multi modal content
-            content: list[ChatCompletionContentPartParam] = []
-            for image in images:
-                content.append(
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": comfy_image_to_base64_png_url(image)
+        with span("user_message", images=len(images) if images is not None else 0):
+            if images is not None:
+                # Build multi modal content
+                content: list[ChatCompletionContentPartParam] = []
+                for image in images:
+                    with span("image", width=image.shape[1], height=image.shape[0]):
+                        content.append(
+                            image_url_part(comfy_image_to_base64_png_url(image, image_detail, image_max_tokens), image_detail)
+                        )
+                    content.append(
+                        {
+                            "type": "text",
+                            "text": prompt
                         }
+                    )
+                # Add the multi-modal content to the messages list
+                messages.append(
+                    {
+                        "role": "user",
+                        "content": content,
                     }
                 )
-                content.append(
+            else:
+                messages.append(
                     {
-                        "type": "text",
-                        "text": prompt
+                        "role": "user",
+                        "content": prompt
                     }
                 )
-            # Add the multi-modal content to the messages list
-            messages.append(
-                {
-                    "role": "user",
-                    "content": content,
-                }
-            )
-        else:
-            messages.append(
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            )
         # Create the completion
-        completion = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            seed=seed,  # deprecated, should we remove it?
-            temperature=temperature,
-            # should be max_completion_tokens but only vLLM has implemented it so far, Ollama and TGI have not
-            max_tokens=max_tokens,
-            top_p=top_p,
-            frequency_penalty=frequency_penalty,
-            presence_penalty=presence_penalty,
-            extra_body=extra_body,
-            n=1
-        )
+        with span("request", model=model, structured=template.json_schema is not None):
+            if template.json_schema is not None:
+                response, usage, parsed = create_structured_completion(client, template, model, messages)
+            else:
+                completion = client.chat.completions.create(**template.build(model, messages))
+                response, usage, parsed = completion.choices[0].message.content, completion.usage, None
         # Add the response to the history
         messages.append(
             {
-                "role": completion.choices[0].message.role,
-                "content": completion.choices[0].message.content
+                "role": "assistant",
+                "content": response
             }
         )
         # Handle usage stats as text preview
-        stats = format_usage(completion.usage)
-        # add it to the console following the openai http call log for now as previewtext does not work yet
-        print(stats)
-        # Return the response and the history and the stats for the UI
-        return io.NodeOutput(
-            completion.choices[0].message.content,
-            HistoryPayload(messages),
-            ui=ui.PreviewText(stats) if stats else ui.PreviewText(""),
-        )
+        return response, messages, parsed, format_usage(usage)
@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING
+
+from comfy_api.latest import io
+
+from .iotypes import ParamClient, ParamEmbeddings, EmbeddingsPayload
+
+if TYPE_CHECKING:
+    import numpy as np
+    import torch
+    from openai import OpenAI
+
+
+class EmbeddingCache:
+    """Content addressed on disk embeddings cache for a given server and model.
+
+    Vectors are appended to a raw float32 file read back as a memory mapped matrix, the index maps the
+    text hashes to their row in the matrix.
+    """
+
+    def __init__(self, directory: str, base_url: str, model: str, dimensions: int) -> None:
+        # Different servers may expose different models under the same name
+        self.namespace = f"{base_url}\0{model}\0{dimensions}"
+        self.directory = os.path.join(directory, hashlib.sha256(self.namespace.encode()).hexdigest()[:16])
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.dim = 0
+        self.rows: dict[str, int] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.dim = index["dim"]
+            self.rows = index["rows"]
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode()).hexdigest()
+
+    def vectors(self) -> np.ndarray:
+        import numpy as np
+        if not self.rows:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype="<f4", mode="r", shape=(len(self.rows), self.dim))
+
+    def add(self, keys: list[str], vectors: np.ndarray) -> None:
+        if not keys:
+            return
+        if self.dim == 0:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"cached embeddings have {self.dim} dimensions, got {vectors.shape[1]}")
+        os.makedirs(self.directory, exist_ok=True)
+        # Append the new vectors first: an interrupted write only leaves unindexed trailing rows
+        with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+            f.seek(len(self.rows) * self.dim * 4)
+            f.write(vectors.astype("<f4", copy=False).tobytes())
+            f.truncate()
+        for key in keys:
+            self.rows[key] = len(self.rows)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"namespace": self.namespace.split("\0"), "dim": self.dim, "rows": self.rows}, f)
+        os.replace(tmp_path, self.index_path)
+
+
+def default_cache_directory() -> str:
+    import folder_paths  # provided by ComfyUI
+    return os.path.join(folder_paths.get_user_directory(), "openai-api", "embeddings")
+
+
+class Embeddings(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_Embeddings",
+            display_name="OpenAI API - Embeddings",
+            category="OpenAI API",
+            description="Computes the embeddings of the given texts (one per line). Texts are sent by concurrent micro batches and the vectors are cached on disk so unchanged texts are never embedded twice.",
+            inputs=[
+                ParamClient.Input(
+                    id="client",
+                    display_name="API Client",
+                    tooltip="The OpenAI API client to use to perform the requests"
+                ),
+                io.String.Input(
+                    id="model",
+                    display_name="Model",
+                    tooltip="The embedding model to use",
+                    placeholder="Model name",
+                ),
+                io.String.Input(
+                    id="texts",
+                    display_name="Texts",
+                    tooltip="The texts to embed, one per line (empty lines are ignored)",
+                    multiline=True,
+                ),
+                io.Int.Input(
+                    id="batch_size",
+                    display_name="Batch Size",
+                    tooltip="Maximum number of texts sent in a single request",
+                    default=64,
+                    min=1,
+                    max=2048,
+                ),
+                io.Int.Input(
+                    id="concurrency",
+                    display_name="Concurrency",
+                    tooltip="Maximum number of requests in flight",
+                    default=4,
+                    min=1,
+                    max=64,
+                ),
+                io.Int.Input(
+                    id="dimensions",
+                    display_name="Dimensions",
+                    tooltip="Number of dimensions of the output vectors if the model supports it, 0 for the model default",
+                    default=0,
+                    min=0,
+                ),
+                io.Boolean.Input(
+                    id="use_cache",
+                    display_name="Use Cache",
+                    tooltip="Reuse and store the vectors in the on disk cache",
+                    default=True,
+                ),
+            ],
+            outputs=[
+                ParamEmbeddings.Output(
+                    id="embeddings",
+                    display_name="Embeddings",
+                    tooltip="The texts and their vectors (a float32 torch tensor of shape (texts, dimensions)), to use with the Embeddings Dedup and Embeddings Search nodes",
+                ),
+            ],
+        )
+
+    @classmethod
+    def validate_inputs(cls, model: str) -> bool | str:
+        if model == "":
+            return "model must be specified"
+        return True
+
+    @classmethod
+    def execute(cls,
+                client: OpenAI,
+                model: str,
+                texts: str,
+                batch_size: int,
+                concurrency: int,
+                dimensions: int,
+                use_cache: bool,
+                ) -> io.NodeOutput:
+        import numpy as np
+        import torch
+        inputs = [line.strip() for line in texts.splitlines() if line.strip()]
+        if not inputs:
+            raise ValueError("no text to embed")
+        # Only request the unique texts missing from the cache
+        cache = EmbeddingCache(default_cache_directory(), str(client.base_url), model, dimensions) if use_cache else None
+        keys = [cache.key(text) for text in inputs] if cache else inputs
+        missing = list(dict.fromkeys(key for key in keys if cache is None or key not in cache.rows))
+        texts_by_key = dict(zip(keys, inputs))
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+        def embed(batch: list[str]) -> np.ndarray:
+            response = client.embeddings.create(
+                model=model,
+                input=[texts_by_key[key] for key in batch],
+                **({"dimensions": dimensions} if dimensions > 0 else {}),
+            )
+            if len(response.data) != len(batch):
+                raise ValueError(f"the server returned {len(response.data)} embeddings for {len(batch)} texts")
+            return np.asarray([data.embedding for data in sorted(response.data, key=lambda d: d.index)],
+                              dtype=np.float32)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(embed, batches))
+        computed = dict(zip(missing, (row for vectors in results for row in vectors)))
+        if cache is not None and computed:
+            cache.add(list(computed), np.stack(list(computed.values())))
+        # Assemble the matrix in the input order
+        if cache is not None:
+            matrix = np.array(cache.vectors()[[cache.rows[key] for key in keys]])
+        else:
+            matrix = np.stack([computed[key] for key in keys])
+        print(f"Embeddings: {len(inputs)} texts, {len(missing)} computed in {len(batches)} requests")
+        return io.NodeOutput(EmbeddingsPayload(inputs, torch.from_numpy(matrix)))
+
+
+def normalize(vectors: torch.Tensor) -> torch.Tensor:
+    import torch
+    # Unit vectors: the dot products are the cosine similarities
+    return torch.nn.functional.normalize(vectors.float(), dim=1)
+
+
+class EmbeddingsDedup(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_EmbeddingsDedup",
+            display_name="OpenAI API - Embeddings Dedup",
+            category="OpenAI API",
+            description="Removes the near duplicate texts (prompts for example): a text is dropped when its cosine similarity with a previous kept text reaches the threshold.",
+            inputs=[
+                ParamEmbeddings.Input(
+                    id="embeddings",
+                    display_name="Embeddings",
+                    tooltip="The texts to deduplicate, from the Embeddings node",
+                ),
+                io.Float.Input(
+                    id="threshold",
+                    display_name="Threshold",
+                    tooltip="Cosine similarity from which two texts are considered duplicates",
+                    default=0.95,
+                    min=0.0,
+                    max=1.0,
+                    step=0.01,
+                ),
+            ],
+            outputs=[
+                io.String.Output(
+                    id="texts",
+                    display_name="Texts",
+                    tooltip="The kept texts, one per line, in the input order",
+                ),
+                ParamEmbeddings.Output(
+                    id="embeddings",
+                    display_name="Embeddings",
+                    tooltip="The kept texts and their vectors",
+                ),
+            ],
+        )
+
+    @classmethod
+    def execute(cls, embeddings: EmbeddingsPayload, threshold: float) -> io.NodeOutput:
+        import torch
+        vectors = normalize(embeddings.vectors)
+        kept_vectors = torch.empty_like(vectors)
+        kept: list[int] = []
+        for i, vector in enumerate(vectors):
+            # Greedy: the first text of a group of near duplicates is kept
+            if kept and float((kept_vectors[:len(kept)] @ vector).max()) >= threshold:
+                continue
+            kept_vectors[len(kept)] = vector
+            kept.append(i)
+        texts = [embeddings.texts[i] for i in kept]
+        print(f"Embeddings dedup: {len(texts)} kept, {len(embeddings.texts) - len(texts)} near duplicates removed")
+        return io.NodeOutput("\n".join(texts), EmbeddingsPayload(texts, embeddings.vectors[kept]))
+
+
+class EmbeddingsSearch(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_EmbeddingsSearch",
+            display_name="OpenAI API - Embeddings Search",
+            category="OpenAI API",
+            description="Retrieves the documents most similar (cosine similarity) to each query, to build a retrieval augmented prompt for example. Both must be embedded with the same model.",
+            inputs=[
+                ParamEmbeddings.Input(
+                    id="documents",
+                    display_name="Documents",
+                    tooltip="The texts to search, from the Embeddings node",
+                ),
+                ParamEmbeddings.Input(
+                    id="queries",
+                    display_name="Queries",
+                    tooltip="The queries, from another Embeddings node using the same model",
+                ),
+                io.Int.Input(
+                    id="top_k",
+                    display_name="Top K",
+                    tooltip="Number of documents retrieved per query",
+                    default=5,
+                    min=1,
+                    max=1000,
+                ),
+            ],
+            outputs=[
+                io.String.Output(
+                    id="results",
+                    display_name="Results",
+                    tooltip="The retrieved documents, one per line from the most similar, the results of each query are separated by an empty line",
+                ),
+            ],
+        )
+
+    @classmethod
+    def execute(cls, documents: EmbeddingsPayload, queries: EmbeddingsPayload, top_k: int) -> io.NodeOutput:
+        import torch
+        if documents.vectors.shape[1] != queries.vectors.shape[1]:
+            raise ValueError(f"documents have {documents.vectors.shape[1]} dimensions but queries have "
+                             f"{queries.vectors.shape[1]}, they must be embedded with the same model")
+        scores = normalize(queries.vectors) @ normalize(documents.vectors).T
+        indices = torch.topk(scores, k=min(top_k, len(documents.texts)), dim=1).indices
+        results = ["\n".join(documents.texts[i] for i in row) for row in indices.tolist()]
+        return io.NodeOutput("\n\n".join(results))
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import mmap
+import os
+import re
+from typing import TYPE_CHECKING, Any
+
+from comfy_api.latest import io, ui
+
+from .iotypes import ParamHistory, HistoryPayload
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+
+HISTORY_FORMAT_VERSION = 1
+DATA_URL_PATTERN = re.compile(r"data:(?P<mime>[\w.+-]+/[\w.+-]+);base64,")
+NAME_PATTERN = re.compile(r"[\w][\w .-]*")
+
+
+class BlobStore:
+    """Content addressed store of the images of the saved histories.
+
+    Images are stored once as raw binary files named after their sha256, shared by all the histories.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def path(self, digest: str, mime: str) -> str:
+        extension = mime.split("/")[-1]
+        return os.path.join(self.directory, digest[:2], f"{digest}.{extension}")
+
+    def put(self, data_url: str) -> dict[str, str] | None:
+        match = DATA_URL_PATTERN.match(data_url)
+        if match is None:
+            return None
+        data = base64.b64decode(data_url[match.end():])
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest, match["mime"])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return {"blob": digest, "mime": match["mime"]}
+
+    def data_url(self, digest: str, mime: str) -> str:
+        # Memory map the blob instead of reading it into an intermediate bytes object
+        with open(self.path(digest, mime), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+
+    def externalize_message(self, message: ChatCompletionMessageParam) -> dict[str, Any]:
+        content = message.get("content")
+        if not isinstance(content, list):
+            return dict(message)
+        parts = []
+        for part in content:
+            if part.get("type") == "image_url" and isinstance(part.get("image_url"), dict):
+                image_url = dict(part["image_url"])
+                blob = self.put(image_url.get("url", ""))
+                if blob is not None:
+                    del image_url["url"]
+                    image_url.update(blob)
+                part = {**part, "image_url": image_url}
+            parts.append(part)
+        return {**message, "content": parts}
+
+    def resolve_message(self, message: ChatCompletionMessageParam) -> ChatCompletionMessageParam:
+        content = message.get("content")
+        if not isinstance(content, list) or \
+                not any(isinstance(part.get("image_url"), dict) and "blob" in part["image_url"] for part in content):
+            return message
+        parts = []
+        for part in content:
+            image_url = part.get("image_url")
+            if isinstance(image_url, dict) and "blob" in image_url:
+                image_url = {key: value for key, value in image_url.items() if key not in ("blob", "mime")}
+                image_url["url"] = self.data_url(part["image_url"]["blob"], part["image_url"]["mime"])
+                part = {**part, "image_url": image_url}
+            parts.append(part)
+        return {**message, "content": parts}  # type: ignore
+
+
+def histories_directory() -> str:
+    import folder_paths  # provided by ComfyUI
+    return os.path.join(folder_paths.get_user_directory(), "openai-api", "histories")
+
+
+def history_path(name: str) -> str:
+    return os.path.join(histories_directory(), f"{name}.json")
+
+
+def validate_name(name: str) -> bool | str:
+    if NAME_PATTERN.fullmatch(name) is None:
+        return "name must only contain letters, digits, spaces, dots, dashes and underscores"
+    return True
+
+
+class SaveHistory(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_SaveHistory",
+            display_name="OpenAI API - Save History",
+            category="OpenAI API/History",
+            description="Saves a conversation history to be restored later with the Load History node. Images are stored once as binary files shared by all the saved histories instead of base64 text.",
+            is_output_node=True,
+            inputs=[
+                ParamHistory.Input(
+                    id="history",
+                    display_name="History",
+                    tooltip="The conversation history to save",
+                ),
+                io.String.Input(
+                    id="name",
+                    display_name="Name",
+                    tooltip="The name of the saved history, an existing history with the same name is replaced",
+                    default="conversation",
+                ),
+            ],
+            outputs=[],
+        )
+
+    @classmethod
+    def validate_inputs(cls, name: str) -> bool | str:
+        return validate_name(name)
+
+    @classmethod
+    def execute(cls, history: HistoryPayload, name: str) -> io.NodeOutput:
+        blobs = BlobStore(os.path.join(histories_directory(), "blobs"))
+        messages = [blobs.externalize_message(message) for message in history.history or []]
+        path = history_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": HISTORY_FORMAT_VERSION, "messages": messages}, f,
+                      ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        return io.NodeOutput(ui=ui.PreviewText(f"{len(messages)} messages saved to {path}"))
+
+
+class LoadHistory(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_LoadHistory",
+            display_name="OpenAI API - Load History",
+            category="OpenAI API/History",
+            description="Loads a conversation history saved with the Save History node. Images are only read from disk when the history is sent in a request.",
+            inputs=[
+                io.String.Input(
+                    id="name",
+                    display_name="Name",
+                    tooltip="The name of the saved history",
+                    default="conversation",
+                ),
+            ],
+            outputs=[
+                ParamHistory.Output(
+                    id="history",
+                    display_name="History",
+                    tooltip="The restored conversation history",
+                ),
+            ],
+        )
+
+    @classmethod
+    def validate_inputs(cls, name: str) -> bool | str:
+        return validate_name(name)
+
+    @classmethod
+    def fingerprint_inputs(cls, name: str) -> str:
+        # Reload when the saved history is replaced
+        path = history_path(name)
+        return f"{name}:{os.path.getmtime(path) if os.path.exists(path) else 0}"
+
+    @classmethod
+    def execute(cls, name: str) -> io.NodeOutput:
+        path = history_path(name)
+        if not os.path.exists(path):
+            raise ValueError(f"no saved history named '{name}'")
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != HISTORY_FORMAT_VERSION:
+            raise ValueError(f"unsupported saved history version: {data.get('version')}")
+        return io.NodeOutput(
+            HistoryPayload(data["messages"], BlobStore(os.path.join(histories_directory(), "blobs")))
+        )
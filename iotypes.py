@@ -1,32 +1,74 @@
+from __future__ import annotations
+
 import json
-from typing import Any
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any
 
 from comfy_api.latest import io
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+from .request import RequestTemplate
+
+if TYPE_CHECKING:
+    import torch
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+    from .history import BlobStore
 
 
 ParamClient = io.Custom("OAIAPI_CLIENT")
 ParamHistory = io.Custom("OAIAPI_HISTORY")
 ParamOptions = io.Custom("OAIAPI_OPTIONS")
+ParamEmbeddings = io.Custom("OAIAPI_EMBEDDINGS")
+
+
+def abbreviate_data_urls(value: Any) -> Any:
+    # Keep the images base64 data out of the text representations
+    if isinstance(value, str) and value.startswith("data:") and len(value) > 64:
+        return f"{value[:48]}...({len(value)} chars)"
+    if isinstance(value, dict):
+        return {key: abbreviate_data_urls(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [abbreviate_data_urls(item) for item in value]
+    return value
 
 
 class HistoryPayload:
-    def __init__(self, history: list[ChatCompletionMessageParam] | None = None) -> None:
+    def __init__(self, history: list[ChatCompletionMessageParam] | None = None, blobs: BlobStore | None = None) -> None:
         self.history = history
+        # Set for loaded histories: their images are stored as blob references, resolved on demand
+        self.blobs = blobs
 
     def get_msgs_copy(self) -> list[ChatCompletionMessageParam]:
-        return self.history.copy() if self.history else []
+        if not self.history:
+            return []
+        if self.blobs is None:
+            return self.history.copy()
+        return [self.blobs.resolve_message(message) for message in self.history]
 
     def __str__(self) -> str:
-        return json.dumps(self.history, indent=4)
+        return json.dumps(abbreviate_data_urls(self.history), indent=4)
+
+
+class EmbeddingsPayload:
+    def __init__(self, texts: list[str], vectors: torch.Tensor) -> None:
+        self.texts = texts
+        # float32 tensor of shape (texts, dimensions), in the texts order
+        self.vectors = vectors
+
+    def __str__(self) -> str:
+        return f"{len(self.texts)} texts embedded in {self.vectors.shape[1]} dimensions"
 
 
 class OptionsPayload:
     def __init__(self, options: dict[str, Any] | None = None) -> None:
-        self.options = options
+        self.options = MappingProxyType(dict(options)) if options else None
+        # Compile (and validate) the request template right away so invalid options fail on the option node
+        self.template = RequestTemplate(self.options)
 
     def get_options_copy(self) -> dict[str, Any]:
         return self.options.copy() if self.options else {}
 
+    def get_template(self) -> RequestTemplate:
+        return self.template
+
     def __str__(self) -> str:
-        return json.dumps(self.options, indent=4)
+        return json.dumps(self.get_options_copy(), indent=4)
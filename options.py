@@ -3,6 +3,7 @@ import json
 from comfy_api.latest import io
 
 from .iotypes import ParamOptions, OptionsPayload
+from .request import BACKEND_PROFILES
 
 
 class OptionSeed(io.ComfyNode):
@@ -349,6 +350,242 @@ class OptionDeveloperRole(io.ComfyNode):
         )
 
 
+class OptionImageDetail(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_ImageDetail",
+            display_name="OpenAI API - Image Detail",
+            category="OpenAI API/Options",
+            description="Controls how much detail the model gets from the input image(s). Images are resized before being encoded so they fit the image token budget, reducing prompt tokens and latency.",
+            inputs=[
+                io.Combo.Input(
+                    id="detail",
+                    display_name="Detail",
+                    tooltip="'low' sends a 512px max image for a fixed low token cost, 'high' lets the model see the image tiles in detail, 'auto' lets the server decide",
+                    options=["auto", "low", "high"],
+                    default="auto",
+                ),
+                io.Int.Input(
+                    id="max_image_tokens",
+                    display_name="Max Image Tokens",
+                    tooltip="Token budget per image: images are downscaled to the 512px tile grid that fits this budget (85 base tokens + 170 per tile). 0 to keep the native resolution.",
+                    default=0,
+                    min=0,
+                    step=85,
+                    display_mode=io.NumberDisplay.number,
+                ),
+                ParamOptions.Input(
+                    id="other_options",
+                    display_name="Options",
+                    optional=True,
+                    tooltip="Others options to merge with",
+                ),
+            ],
+            outputs=[
+                ParamOptions.Output(
+                    id="options",
+                    display_name="Options",
+                    tooltip="Merged options to forward",
+                ),
+            ],
+        )
+
+    @classmethod
+    def execute(cls,
+                detail: str,
+                max_image_tokens: int,
+                other_options: OptionsPayload | None = None,
+                ) -> io.NodeOutput:
+        if other_options is None:
+            options = {"image_detail": detail, "image_max_tokens": max_image_tokens}
+        else:
+            options = other_options.get_options_copy()
+            options["image_detail"] = detail
+            options["image_max_tokens"] = max_image_tokens
+        return io.NodeOutput(
+            OptionsPayload(options)
+        )
+
+
+class OptionBackend(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_Backend",
+            display_name="OpenAI API - Backend",
+            category="OpenAI API/Options",
+            description="Declares the inference server behind the client so options it does not support are rejected when the options are built instead of by the server.",
+            inputs=[
+                io.Combo.Input(
+                    id="backend",
+                    display_name="Backend",
+                    tooltip="The inference server type, 'generic' only checks the known parameters types and ranges",
+                    options=list(BACKEND_PROFILES),
+                    default="generic",
+                ),
+                ParamOptions.Input(
+                    id="other_options",
+                    display_name="Options",
+                    optional=True,
+                    tooltip="Others options to merge with",
+                ),
+            ],
+            outputs=[
+                ParamOptions.Output(
+                    id="options",
+                    display_name="Options",
+                    tooltip="Merged options to forward",
+                ),
+            ],
+        )
+
+    @classmethod
+    def execute(cls,
+                backend: str,
+                other_options: OptionsPayload | None = None,
+                ) -> io.NodeOutput:
+        if other_options is None:
+            options = {"backend": backend}
+        else:
+            options = other_options.get_options_copy()
+            options["backend"] = backend
+        return io.NodeOutput(
+            OptionsPayload(options)
+        )
+
+
+class OptionStructuredOutput(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_StructuredOutput",
+            display_name="OpenAI API - Structured Output",
+            category="OpenAI API/Options",
+            description="Constrains the response to a JSON document following the given JSON schema. The response is validated while it is generated (aborting as soon as it is invalid) and the decoded value is available on the chat completion 'JSON' output.",
+            inputs=[
+                io.String.Input(
+                    id="json_schema",
+                    display_name="JSON Schema",
+                    tooltip="The JSON schema the response must follow",
+                    multiline=True,
+                    default=json.dumps({
+                        "type": "object",
+                        "properties": {"tags": {"type": "array", "items": {"type": "string"}}},
+                        "required": ["tags"],
+                        "additionalProperties": False,
+                    }, indent=4),
+                ),
+                io.String.Input(
+                    id="name",
+                    display_name="Name",
+                    tooltip="The name of the schema, only used with the response format mode",
+                    default="output",
+                ),
+                io.Combo.Input(
+                    id="mode",
+                    display_name="Mode",
+                    tooltip="'response_format' is the standard OpenAI API parameter, 'guided_json' uses vLLM guided decoding thru the extra body",
+                    options=["response_format", "guided_json"],
+                    default="response_format",
+                ),
+                io.Boolean.Input(
+                    id="strict",
+                    display_name="Strict",
+                    tooltip="Enables the OpenAI strict schema adherence, only used with the response format mode",
+                    default=False,
+                ),
+                ParamOptions.Input(
+                    id="other_options",
+                    display_name="Options",
+                    optional=True,
+                    tooltip="Others options to merge with",
+                ),
+            ],
+            outputs=[
+                ParamOptions.Output(
+                    id="options",
+                    display_name="Options",
+                    tooltip="Merged options to forward",
+                ),
+            ],
+        )
+
+    @classmethod
+    def validate_inputs(cls, json_schema: str) -> bool | str:
+        try:
+            data = json.loads(json_schema)
+            if not isinstance(data, dict):
+                return "JSON schema must be a JSON object (dictionary)"
+        except json.JSONDecodeError as e:
+            return f"JSON schema is not a valid JSON: {e}"
+        return True
+
+    @classmethod
+    def execute(cls,
+                json_schema: str,
+                name: str,
+                mode: str,
+                strict: bool,
+                other_options: OptionsPayload | None = None,
+                ) -> io.NodeOutput:
+        structured_output = {"schema": json.loads(json_schema), "name": name, "mode": mode, "strict": strict}
+        if other_options is None:
+            options = {"structured_output": structured_output}
+        else:
+            options = other_options.get_options_copy()
+            options["structured_output"] = structured_output
+        return io.NodeOutput(
+            OptionsPayload(options)
+        )
+
+
+class OptionProfile(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_Profile",
+            display_name="OpenAI API - Profile",
+            category="OpenAI API/Options",
+            description="Profiles the chat completion execution with cProfile and tracemalloc and appends the summary to the node stats. Profiling slows down the execution, only use it to investigate.",
+            inputs=[
+                io.Boolean.Input(
+                    id="profile",
+                    display_name="Profile",
+                    tooltip="Set this switch to true to profile the chat completion execution",
+                    default=True,
+                ),
+                ParamOptions.Input(
+                    id="other_options",
+                    display_name="Options",
+                    optional=True,
+                    tooltip="Others options to merge with",
+                ),
+            ],
+            outputs=[
+                ParamOptions.Output(
+                    id="options",
+                    display_name="Options",
+                    tooltip="Merged options to forward",
+                ),
+            ],
+        )
+
+    @classmethod
+    def execute(cls,
+                profile: bool,
+                other_options: OptionsPayload | None = None,
+                ) -> io.NodeOutput:
+        if other_options is None:
+            options = {"profile": profile}
+        else:
+            options = other_options.get_options_copy()
+            options["profile"] = profile
+        return io.NodeOutput(
+            OptionsPayload(options)
+        )
+
+
 class OptionExtraBody(io.ComfyNode):
     @classmethod
     def define_schema(cls) -> io.Schema:
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Mapping
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+
+# Request parameters with a dedicated option node: expected type and allowed range
+KNOWN_PARAMETERS: dict[str, tuple[type, float | None, float | None]] = {
+    "seed": (int, None, None),
+    "temperature": (float, 0.0, 2.0),
+    # should be max_completion_tokens but only vLLM has implemented it so far, Ollama and TGI have not
+    "max_tokens": (int, 1, None),
+    "top_p": (float, 0.0, 1.0),
+    "frequency_penalty": (float, -2.0, 2.0),
+    "presence_penalty": (float, -2.0, 2.0),
+}
+
+# Options consumed by the nodes themselves, never sent to the server
+IMAGE_DETAILS = ("auto", "low", "high")
+STRUCTURED_OUTPUT_MODES = ("response_format", "guided_json")
+NODE_OPTIONS = ("use_developer_role", "image_detail", "image_max_tokens", "backend", "structured_output", "profile")
+
+# Sampling parameters only understood by vLLM
+VLLM_PARAMETERS = frozenset([
+    "top_k", "min_p", "repetition_penalty", "length_penalty", "min_tokens", "ignore_eos",
+    "skip_special_tokens", "spaces_between_special_tokens", "truncate_prompt_tokens",
+    "guided_json", "guided_regex", "guided_choice", "guided_grammar", "guided_decoding_backend",
+    "structured_outputs", "chat_template", "chat_template_kwargs",
+])
+
+# Parameters each backend rejects or silently ignores, "generic" does not check anything
+BACKEND_PROFILES: dict[str, frozenset[str]] = {
+    "generic": frozenset(),
+    "openai": VLLM_PARAMETERS,
+    "vllm": frozenset(),
+    "ollama": VLLM_PARAMETERS | {"logit_bias", "n", "user"},
+    "tgi": VLLM_PARAMETERS | {"logit_bias", "n", "user"},
+}
+
+
+def check_known_parameter(key: str, value: Any) -> Any:
+    expected, minimum, maximum = KNOWN_PARAMETERS[key]
+    # bool is a subclass of int, do not let it pass as a number
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+            (expected is int and not isinstance(value, int)):
+        raise ValueError(f"'{key}' must be of type {expected.__name__}, got {type(value).__name__}")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise ValueError(f"'{key}' must be between {minimum} and {maximum}, got {value}")
+    return expected(value)
+
+
+class RequestTemplate:
+    """Immutable and validated chat completion parameters compiled from an options chain.
+
+    The static part of the request is computed once: each request only merges the model and the messages in.
+    """
+    __slots__ = ("backend", "use_developer_role", "image_detail", "image_max_tokens", "json_schema", "profile",
+                 "_params")
+
+    def __init__(self, options: Mapping[str, Any] | None = None) -> None:
+        options = options or {}
+        # Backend profile
+        backend = options.get("backend", "generic")
+        if backend not in BACKEND_PROFILES:
+            raise ValueError(f"unknown backend '{backend}', expected one of: {', '.join(BACKEND_PROFILES)}")
+        unsupported = BACKEND_PROFILES[backend]
+        # Split node options, known parameters and extra body
+        params: dict[str, Any] = {"n": 1}
+        extra_body: dict[str, Any] = {}
+        for key, value in options.items():
+            if key in unsupported:
+                raise ValueError(f"'{key}' is not supported by the {backend} backend")
+            if key in KNOWN_PARAMETERS:
+                params[key] = check_known_parameter(key, value)
+            elif key not in NODE_OPTIONS:
+                extra_body[key] = value
+        # Structured output, either thru the standard response format or vLLM guided decoding
+        json_schema: dict[str, Any] | None = None
+        structured_output = options.get("structured_output")
+        if structured_output is not None:
+            json_schema = structured_output["schema"]
+            if not isinstance(json_schema, dict):
+                raise ValueError("structured output schema must be a JSON object")
+            mode = structured_output.get("mode", "response_format")
+            if mode not in STRUCTURED_OUTPUT_MODES:
+                raise ValueError(f"structured output mode must be one of: {', '.join(STRUCTURED_OUTPUT_MODES)}")
+            if mode in unsupported:
+                raise ValueError(f"'{mode}' is not supported by the {backend} backend")
+            if mode == "guided_json":
+                extra_body["guided_json"] = json_schema
+            else:
+                params["response_format"] = {
+                    "type": "json_schema",
+                    "json_schema": {
+                        "name": structured_output.get("name", "output"),
+                        "schema": json_schema,
+                        "strict": bool(structured_output.get("strict", False)),
+                    },
+                }
+        if extra_body:
+            params["extra_body"] = MappingProxyType(extra_body)
+        # Node options
+        image_detail = options.get("image_detail")
+        if image_detail is not None and image_detail not in IMAGE_DETAILS:
+            raise ValueError(f"'image_detail' must be one of: {', '.join(IMAGE_DETAILS)}")
+        image_max_tokens = options.get("image_max_tokens", 0)
+        if isinstance(image_max_tokens, bool) or not isinstance(image_max_tokens, int) or image_max_tokens < 0:
+            raise ValueError("'image_max_tokens' must be a positive integer")
+        set_attr = super().__setattr__
+        set_attr("backend", backend)
+        set_attr("use_developer_role", bool(options.get("use_developer_role", False)))
+        set_attr("image_detail", image_detail)
+        set_attr("image_max_tokens", image_max_tokens)
+        set_attr("json_schema", json_schema)
+        set_attr("profile", bool(options.get("profile", False)))
+        set_attr("_params", MappingProxyType(params))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("RequestTemplate is immutable")
+
+    @property
+    def params(self) -> Mapping[str, Any]:
+        return self._params
+
+    def build(self, model: str, messages: list[ChatCompletionMessageParam]) -> dict[str, Any]:
+        # Keyword arguments for client.chat.completions.create(), the nested extra body is copied too
+        request = {**self._params, "model": model, "messages": messages}
+        if "extra_body" in request:
+            request["extra_body"] = dict(request["extra_body"])
+        return request
+
+
+EMPTY_TEMPLATE = RequestTemplate()
@@ -0,0 +1,190 @@
+import json
+import re
+from typing import Any
+
+
+NUMBER_PATTERN = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?")
+NUMBER_CHARS = frozenset("0123456789+-.eE")
+HEX_CHARS = frozenset("0123456789abcdefABCDEF")
+ESCAPE_CHARS = frozenset('"\\/bfnrtu')
+WHITESPACES = frozenset(" \t\n\r")
+LITERALS = {"t": "true", "f": "false", "n": "null"}
+
+# Parser states
+VALUE = 0           # a value is expected
+VALUE_OR_END = 1    # right after '[': a value or ']'
+KEY_OR_END = 2      # right after '{': a key or '}'
+KEY = 3             # after ',' in an object: a key
+COLON = 4           # after a key
+AFTER_VALUE = 5     # after a value: ',' or the container end
+STRING = 6
+ESCAPE = 7
+UNICODE = 8
+NUMBER = 9
+LITERAL = 10
+
+
+class IncrementalJSONParser:
+    """Validates a JSON document chunk by chunk, as it is generated.
+
+    feed() raises a ValueError as soon as the text received so far can not be the beginning of a valid
+    JSON document, allowing to abort the generation early. close() returns the decoded document.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: list[str] = []
+        self.position = 0
+        self.state = VALUE
+        self.containers: list[str] = []
+        self.string_is_key = False
+        self.pending = ""  # number being read, remaining literal chars or unicode escape digits
+
+    def feed(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        for char in chunk:
+            self._feed_char(char)
+            self.position += 1
+
+    def close(self) -> Any:
+        if self.state == NUMBER:
+            self._end_number()
+        if self.state != AFTER_VALUE or self.containers:
+            raise ValueError("truncated JSON document")
+        return json.loads(self.text)
+
+    @property
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"{message} at char {self.position}")
+
+    def _feed_char(self, char: str) -> None:
+        state = self.state
+        if state == STRING:
+            if char == '"':
+                self.state = COLON if self.string_is_key else AFTER_VALUE
+            elif char == "\\":
+                self.state = ESCAPE
+            elif char < " ":
+                raise self._error("control character in string")
+        elif state == ESCAPE:
+            if char not in ESCAPE_CHARS:
+                raise self._error(f"invalid escape '\\{char}'")
+            if char == "u":
+                self.pending = ""
+                self.state = UNICODE
+            else:
+                self.state = STRING
+        elif state == UNICODE:
+            if char not in HEX_CHARS:
+                raise self._error("invalid unicode escape")
+            self.pending += char
+            if len(self.pending) == 4:
+                self.state = STRING
+        elif state == NUMBER:
+            if char in NUMBER_CHARS:
+                self.pending += char
+            else:
+                self._end_number()
+                self._feed_char(char)
+        elif state == LITERAL:
+            if char != self.pending[0]:
+                raise self._error("invalid literal")
+            self.pending = self.pending[1:]
+            if not self.pending:
+                self.state = AFTER_VALUE
+        elif char in WHITESPACES:
+            return
+        elif state == VALUE or state == VALUE_OR_END:
+            if state == VALUE_OR_END and char == "]":
+                self._end_container("array")
+            else:
+                self._start_value(char)
+        elif state == KEY_OR_END or state == KEY:
+            if char == '"':
+                self.string_is_key = True
+                self.state = STRING
+            elif state == KEY_OR_END and char == "}":
+                self._end_container("object")
+            else:
+                raise self._error("object key expected")
+        elif state == COLON:
+            if char != ":":
+                raise self._error("':' expected")
+            self.state = VALUE
+        elif state == AFTER_VALUE:
+            if not self.containers:
+                raise self._error("extra data after the JSON document")
+            if char == ",":
+                self.state = KEY if self.containers[-1] == "object" else VALUE
+            elif char == "}":
+                self._end_container("object")
+            elif char == "]":
+                self._end_container("array")
+            else:
+                raise self._error("',' or container end expected")
+
+    def _start_value(self, char: str) -> None:
+        if char == "{":
+            self.containers.append("object")
+            self.state = KEY_OR_END
+        elif char == "[":
+            self.containers.append("array")
+            self.state = VALUE_OR_END
+        elif char == '"':
+            self.string_is_key = False
+            self.state = STRING
+        elif char == "-" or char.isdigit():
+            self.pending = char
+            self.state = NUMBER
+        elif char in LITERALS:
+            self.pending = LITERALS[char][1:]
+            self.state = LITERAL
+        else:
+            raise self._error(f"unexpected '{char}'")
+
+    def _end_number(self) -> None:
+        if NUMBER_PATTERN.fullmatch(self.pending) is None:
+            raise self._error(f"invalid number '{self.pending}'")
+        self.state = AFTER_VALUE
+
+    def _end_container(self, kind: str) -> None:
+        if not self.containers or self.containers[-1] != kind:
+            raise self._error(f"unexpected end of {kind}")
+        self.containers.pop()
+        self.state = AFTER_VALUE
+
+
+JSON_TYPES: dict[str, tuple[type, ...]] = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int,),
+    "boolean": (bool,),
+    "null": (type(None),),
+}
+
+
+def check_schema(value: Any, schema: dict[str, Any], path: str = "$") -> None:
+    # Only the common JSON schema keywords are checked, guided decoding servers enforce the rest
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        # bool is a subclass of int, do not let it pass as a number
+        if not any(isinstance(value, JSON_TYPES.get(name, object)) and
+                   not (isinstance(value, bool) and name in ("number", "integer")) for name in types):
+            raise ValueError(f"{path}: expected {' or '.join(types)}, got {type(value).__name__}")
+    if "enum" in schema and value not in schema["enum"]:
+        raise ValueError(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                raise ValueError(f"{path}: missing required property '{key}'")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                check_schema(value[key], subschema, f"{path}.{key}")
+    elif isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for index, item in enumerate(value):
+            check_schema(item, schema["items"], f"{path}[{index}]")
@@ -0,0 +1,13 @@
+import os
+import sys
+import types
+
+# The repository root is a ComfyUI custom node package whose __init__ needs a running ComfyUI. Register it
+# as a bare package (under its directory name too, as pytest imports it while collecting) so its standalone
+# modules can be imported and tested without ComfyUI.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+package = types.ModuleType("oaiapi")
+package.__path__ = [ROOT]
+package.__file__ = os.path.join(ROOT, "__init__.py")
+sys.modules.setdefault("oaiapi", package)
+sys.modules.setdefault(os.path.basename(ROOT), package)
@@ -0,0 +1,99 @@
+import re
+
+import pytest
+
+from oaiapi.request import EMPTY_TEMPLATE, RequestTemplate
+
+SCHEMA = {"type": "object", "properties": {"a": {"type": "integer"}}}
+
+
+def test_empty_template():
+    assert dict(EMPTY_TEMPLATE.params) == {"n": 1}
+    assert EMPTY_TEMPLATE.backend == "generic"
+    assert EMPTY_TEMPLATE.use_developer_role is False
+    assert EMPTY_TEMPLATE.image_detail is None
+    assert EMPTY_TEMPLATE.image_max_tokens == 0
+    assert EMPTY_TEMPLATE.json_schema is None
+
+
+def test_splits_known_parameters_node_options_and_extra_body():
+    template = RequestTemplate({
+        "temperature": 1,
+        "seed": 3,
+        "top_k": 20,
+        "use_developer_role": True,
+        "image_detail": "low",
+        "image_max_tokens": 765,
+    })
+    assert dict(template.params) == {"n": 1, "temperature": 1.0, "seed": 3, "extra_body": {"top_k": 20}}
+    assert isinstance(template.params["temperature"], float)
+    assert template.use_developer_role is True
+    assert template.image_detail == "low"
+    assert template.image_max_tokens == 765
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"temperature": "1"}, "'temperature' must be of type float, got str"),
+    ({"temperature": True}, "'temperature' must be of type float, got bool"),
+    ({"seed": 1.5}, "'seed' must be of type int, got float"),
+    ({"seed": False}, "'seed' must be of type int, got bool"),
+    ({"temperature": 2.5}, "'temperature' must be between 0.0 and 2.0, got 2.5"),
+    ({"top_p": -0.1}, "'top_p' must be between 0.0 and 1.0"),
+    ({"max_tokens": 0}, "'max_tokens' must be between 1 and None, got 0"),
+    ({"image_detail": "medium"}, "'image_detail' must be one of: auto, low, high"),
+    ({"image_max_tokens": -1}, "'image_max_tokens' must be a positive integer"),
+    ({"image_max_tokens": True}, "'image_max_tokens' must be a positive integer"),
+    ({"backend": "llamacpp"}, "unknown backend 'llamacpp'"),
+    ({"backend": "openai", "top_k": 20}, "'top_k' is not supported by the openai backend"),
+    ({"backend": "ollama", "logit_bias": {}}, "'logit_bias' is not supported by the ollama backend"),
+    ({"structured_output": {"schema": []}}, "structured output schema must be a JSON object"),
+    ({"structured_output": {"schema": SCHEMA, "mode": "grammar"}}, "structured output mode must be one of"),
+    ({"backend": "tgi", "structured_output": {"schema": SCHEMA, "mode": "guided_json"}},
+     "'guided_json' is not supported by the tgi backend"),
+])
+def test_rejects_invalid_options(options, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        RequestTemplate(options)
+
+
+@pytest.mark.parametrize("backend", ["generic", "vllm"])
+def test_permissive_backends_accept_vllm_parameters(backend):
+    template = RequestTemplate({"backend": backend, "min_p": 0.1})
+    assert dict(template.params["extra_body"]) == {"min_p": 0.1}
+
+
+def test_structured_output_response_format():
+    template = RequestTemplate({"structured_output": {"schema": SCHEMA, "name": "result", "strict": 1}})
+    assert template.json_schema is SCHEMA
+    assert template.params["response_format"] == {
+        "type": "json_schema",
+        "json_schema": {"name": "result", "schema": SCHEMA, "strict": True},
+    }
+    assert "extra_body" not in template.params
+
+
+def test_structured_output_guided_json():
+    template = RequestTemplate({"backend": "vllm", "structured_output": {"schema": SCHEMA, "mode": "guided_json"}})
+    assert template.params["extra_body"]["guided_json"] is SCHEMA
+    assert "response_format" not in template.params
+
+
+def test_template_is_immutable():
+    template = RequestTemplate({"temperature": 0.5, "top_k": 20})
+    with pytest.raises(AttributeError):
+        template.backend = "vllm"
+    with pytest.raises(TypeError):
+        template.params["temperature"] = 1.0  # type: ignore
+    with pytest.raises(TypeError):
+        template.params["extra_body"]["top_k"] = 1  # type: ignore
+
+
+def test_build_returns_independent_requests():
+    template = RequestTemplate({"temperature": 0.5, "top_k": 20})
+    messages = [{"role": "user", "content": "hi"}]
+    request = template.build("model", messages)
+    assert request == {"n": 1, "temperature": 0.5, "extra_body": {"top_k": 20}, "model": "model", "messages": messages}
+    request["temperature"] = 1.0
+    request["extra_body"]["top_k"] = 1
+    assert template.build("model", messages)["temperature"] == 0.5
+    assert template.build("model", messages)["extra_body"] == {"top_k": 20}
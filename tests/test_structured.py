@@ -0,0 +1,174 @@
+import json
+
+import pytest
+
+from oaiapi.structured import IncrementalJSONParser, check_schema
+
+VALID_DOCUMENTS = [
+    '{}',
+    '[]',
+    ' { "a" : [ 1 , 2 ] } \n',
+    '{"a": {"b": [true, false, null]}, "c": ""}',
+    '[[], {}, [[{}]]]',
+    '"text"',
+    '"escapes \\" \\\\ \\/ \\b \\f \\n \\r \\t"',
+    '"\\u00e9\\ud83d\\ude00 é"',
+    '0',
+    '-0',
+    '12',
+    '-12.5',
+    '0.5e-3',
+    '1E+2',
+    '1e10',
+    'true',
+    'false',
+    'null',
+    '[1,-2.5e3,"x",null]',
+]
+
+INVALID_DOCUMENTS = [
+    '',
+    '   ',
+    '{',
+    '[1, 2',
+    '{"a": 1',
+    '{"a"',
+    '{"a":',
+    '"unterminated',
+    '[1,]',
+    '{"a": 1,}',
+    '{,}',
+    '{1: 2}',
+    "{'a': 1}",
+    '{"a" 1}',
+    '[1}',
+    '{"a": 1]',
+    '{}}',
+    '[] []',
+    '1 2',
+    'truefalse',
+    '"a" "b"',
+    '01',
+    '-',
+    '1.',
+    '.5',
+    '+1',
+    '1e',
+    '1e+',
+    '1-2',
+    '--1',
+    'tru',
+    'trux',
+    'nul',
+    'True',
+    'NaN',
+    'Infinity',
+    '"\\x"',
+    '"\\u12g4"',
+    '"\\u12"',
+    '"line\nbreak"',
+    '"tab\tinside"',
+]
+
+
+def parse(text, chunk_size=None):
+    parser = IncrementalJSONParser()
+    chunk_size = chunk_size or max(1, len(text))
+    for i in range(0, len(text), chunk_size):
+        parser.feed(text[i:i + chunk_size])
+    return parser.close()
+
+
+@pytest.mark.parametrize("text", VALID_DOCUMENTS)
+@pytest.mark.parametrize("chunk_size", [None, 1, 3])
+def test_valid_documents_match_json_loads(text, chunk_size):
+    assert parse(text, chunk_size) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", INVALID_DOCUMENTS)
+@pytest.mark.parametrize("chunk_size", [None, 1])
+def test_invalid_documents_are_rejected(text, chunk_size):
+    with pytest.raises(ValueError):
+        parse(text, chunk_size)
+
+
+@pytest.mark.parametrize("text", ['{"a": [1, "b\\u00e9", true], "c": -1.5e2}', '"\\\\\\"x"', 'null'])
+def test_every_chunk_boundary(text):
+    for i in range(len(text) + 1):
+        parser = IncrementalJSONParser()
+        parser.feed(text[:i])
+        parser.feed(text[i:])
+        assert parser.close() == json.loads(text)
+        assert parser.text == text
+
+
+@pytest.mark.parametrize("prefix", ['{"a": x', '[1,,', '{"a": 1}}', '"\\q', '[tr1', '{"a": 1 "b"'])
+def test_invalid_prefix_fails_while_feeding(prefix):
+    # The generation is aborted as soon as the text can not be a valid document anymore
+    parser = IncrementalJSONParser()
+    with pytest.raises(ValueError, match="at char"):
+        parser.feed(prefix)
+
+
+@pytest.mark.parametrize("prefix", ['{"a": [1, 2', '"abc', '-1e', 'fal', '{"a', '[{"b": "\\u00'])
+def test_valid_prefix_only_fails_when_closed(prefix):
+    parser = IncrementalJSONParser()
+    parser.feed(prefix)
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_number_ending_a_container_is_checked():
+    parser = IncrementalJSONParser()
+    with pytest.raises(ValueError, match="invalid number '1.'"):
+        parser.feed("[1.]")
+
+
+SCHEMA = {
+    "type": "object",
+    "required": ["name", "score"],
+    "properties": {
+        "name": {"type": "string"},
+        "score": {"type": "number"},
+        "count": {"type": "integer"},
+        "valid": {"type": "boolean"},
+        "tag": {"type": ["string", "null"], "enum": ["a", "b", None]},
+        "items": {"type": "array", "items": {"type": "integer"}},
+    },
+}
+
+
+@pytest.mark.parametrize("value", [
+    {"name": "x", "score": 1},
+    {"name": "x", "score": 1.5, "count": 2, "valid": False, "tag": None, "items": [1, 2]},
+    {"name": "x", "score": 0, "tag": "b", "other": object()},
+])
+def test_check_schema_accepts(value):
+    check_schema(value, SCHEMA)
+
+
+@pytest.mark.parametrize("value, message", [
+    ([], r"\$: expected object, got list"),
+    ({"name": "x"}, r"\$: missing required property 'score'"),
+    ({"name": 1, "score": 1}, r"\$\.name: expected string, got int"),
+    ({"name": "x", "score": "1"}, r"\$\.score: expected number, got str"),
+    ({"name": "x", "score": 1, "count": 1.5}, r"\$\.count: expected integer, got float"),
+    ({"name": "x", "score": 1, "valid": 1}, r"\$\.valid: expected boolean, got int"),
+    ({"name": "x", "score": 1, "tag": 1}, r"\$\.tag: expected string or null, got int"),
+    ({"name": "x", "score": 1, "tag": "c"}, r"\$\.tag: 'c' is not one of"),
+    ({"name": "x", "score": 1, "items": [1, "2"]}, r"\$\.items\[1\]: expected integer, got str"),
+])
+def test_check_schema_rejects(value, message):
+    with pytest.raises(ValueError, match=message):
+        check_schema(value, SCHEMA)
+
+
+@pytest.mark.parametrize("name", ["number", "integer"])
+def test_check_schema_bool_is_not_a_number(name):
+    with pytest.raises(ValueError, match=f"expected {name}, got bool"):
+        check_schema(True, {"type": name})
+
+
+def test_check_schema_ignores_unknown_keywords_and_types():
+    check_schema("x", {"type": "custom", "minLength": 5, "format": "email"})
+    check_schema(1, {})
@@ -0,0 +1,145 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import httpx
+import pytest
+
+from oaiapi import transport
+from oaiapi.transport import RetryTransport, backoff
+
+
+def make_client(handler, max_retries=2, deadline=10.0, read_timeout=5.0, wrapped=None):
+    return httpx.Client(transport=RetryTransport(
+        wrapped or httpx.MockTransport(handler),
+        max_retries=max_retries,
+        deadline=deadline,
+        connect_timeout=1.0,
+        first_token_timeout=5.0,
+        read_timeout=read_timeout,
+    ))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(transport.time, "sleep", slept.append)
+    return slept
+
+
+def test_retries_unprocessed_statuses(sleeps):
+    statuses = iter([503, 429, 200])
+    calls = []
+
+    def handler(request):
+        calls.append(request.headers["x-stainless-retry-count"])
+        return httpx.Response(next(statuses))
+
+    assert make_client(handler).post("http://test/").status_code == 200
+    assert calls == ["0", "1", "2"]
+    assert len(sleeps) == 2
+
+
+def test_does_not_retry_processed_failures(sleeps):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(500)
+
+    assert make_client(handler).post("http://test/").status_code == 500
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_retries_connection_errors_only(sleeps):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        raise httpx.ReadTimeout("timed out", request=request)
+
+    with pytest.raises(httpx.ReadTimeout):
+        make_client(handler).post("http://test/")
+    assert len(calls) == 2
+
+
+def test_honors_retry_after(sleeps):
+    statuses = iter([httpx.Response(429, headers={"retry-after": "3"}), httpx.Response(200)])
+    assert make_client(lambda request: next(statuses)).post("http://test/").status_code == 200
+    assert sleeps == [3.0]
+
+
+def test_long_retry_after_is_kept():
+    assert backoff(0, httpx.Response(503, headers={"retry-after": "120"})) == 120.0
+    assert backoff(0, httpx.Response(503, headers={"retry-after-ms": "1500"})) == 1.5
+
+
+def test_returns_response_when_retry_after_exceeds_deadline(sleeps):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503, headers={"retry-after": "120"})
+
+    assert make_client(handler, deadline=10.0).post("http://test/").status_code == 503
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_switches_to_read_timeout_after_headers():
+    seen = {}
+
+    def handler(request):
+        seen["first_token"] = request.extensions["timeout"]["read"]
+        return httpx.Response(200, content=iter([b"ok"]))
+
+    client = make_client(handler, read_timeout=2.0)
+    response = client.post("http://test/")
+    assert seen["first_token"] == pytest.approx(5.0, abs=0.1)
+    assert response.request.extensions["timeout"]["read"] == pytest.approx(2.0, abs=0.1)
+
+
+def test_deadline_enforced_while_reading_body():
+    def slow_body():
+        for _ in range(20):
+            time.sleep(0.05)
+            yield b"x"
+
+    client = make_client(lambda request: httpx.Response(200, content=slow_body()), deadline=0.3)
+    start = time.monotonic()
+    with pytest.raises(httpx.ReadTimeout):
+        client.post("http://test/")
+    assert time.monotonic() - start < 0.6
+
+
+class SlowBodyHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "100")
+        self.end_headers()
+        self.wfile.flush()
+        # Each chunk arrives well within the read timeout, the whole body does not fit in the deadline
+        for _ in range(100):
+            time.sleep(0.05)
+            self.wfile.write(b"x")
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_deadline_enforced_with_a_real_connection():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowBodyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = make_client(None, deadline=0.5, read_timeout=1.0, wrapped=httpx.HTTPTransport())
+        start = time.monotonic()
+        with pytest.raises(httpx.ReadTimeout):
+            client.post(f"http://127.0.0.1:{server.server_address[1]}/")
+        assert time.monotonic() - start < 1.0
+    finally:
+        server.shutdown()
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from contextlib import contextmanager, ExitStack
+from contextvars import ContextVar
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Any, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Tracing is disabled by default, it is enabled with environment variables:
+# - OAIAPI_TRACE_FILE: path of a JSON lines file receiving the finished spans (OpenTelemetry span fields)
+# - OAIAPI_TRACE_OTEL: set to 1 to also emit the spans thru the OpenTelemetry API, exported by the
+#   OpenTelemetry SDK configured in the ComfyUI process (local file, collector, etc...)
+TRACE_FILE = os.environ.get("OAIAPI_TRACE_FILE", "")
+TRACE_OTEL = os.environ.get("OAIAPI_TRACE_OTEL", "") not in ("", "0", "false")
+ENABLED = bool(TRACE_FILE) or TRACE_OTEL
+
+# (trace_id, span_id) of the current span
+current_span: ContextVar[tuple[str, str] | None] = ContextVar("oaiapi_current_span", default=None)
+trace_file_lock = threading.Lock()
+
+
+def export_span(record: dict[str, Any]) -> None:
+    line = json.dumps(record, default=str) + "\n"
+    with trace_file_lock:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[dict[str, Any]]:
+    """Traces the enclosed block. The yielded dict can be used to add attributes once they are known."""
+    if not ENABLED:
+        yield attributes
+        return
+    parent = current_span.get()
+    trace_id = parent[0] if parent else secrets.token_hex(16)
+    span_id = secrets.token_hex(8)
+    token = current_span.set((trace_id, span_id))
+    status = "OK"
+    start = time.time_ns()
+    with ExitStack() as stack:
+        otel_span = None
+        if TRACE_OTEL:
+            from opentelemetry import trace
+            otel_span = stack.enter_context(trace.get_tracer("comfyui-openai-api").start_as_current_span(name))
+        try:
+            yield attributes
+        except BaseException as e:
+            status = f"ERROR: {type(e).__name__}: {e}"
+            raise
+        finally:
+            end = time.time_ns()
+            current_span.reset(token)
+            if otel_span is not None:
+                otel_span.set_attributes({k: v for k, v in attributes.items() if v is not None})
+            if TRACE_FILE:
+                export_span({
+                    "name": name,
+                    "trace_id": trace_id,
+                    "span_id": span_id,
+                    "parent_span_id": parent[1] if parent else None,
+                    "start_time_unix_nano": start,
+                    "end_time_unix_nano": end,
+                    "duration_ms": (end - start) / 1e6,
+                    "attributes": attributes,
+                    "status": status,
+                })
+
+
+def profile(fn: Callable[[], T], top: int = 15) -> tuple[T, str]:
+    """Runs fn under cProfile and tracemalloc, returns its result and a text summary."""
+    import cProfile
+    import io
+    import pstats
+    import tracemalloc
+    profiler = cProfile.Profile()
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_snapshot = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    try:
+        result = profiler.runcall(fn)
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().compare_to(start_snapshot, "lineno")[:5]
+        if not already_tracing:
+            tracemalloc.stop()
+    # Text summary
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(top)
+    summary = f"Profile: {elapsed * 1000:.1f} ms, peak traced memory {peak / 2**20:.1f} MiB\n"
+    summary += "Top allocations:\n" + "\n".join(f"  {stat}" for stat in allocations) + "\n"
+    summary += stream.getvalue()
+    return result, summary
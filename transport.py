@@ -0,0 +1,162 @@
+from email.utils import parsedate_to_datetime
+import random
+import time
+from typing import Iterator
+
+import httpx
+
+from .tracing import span
+
+
+# Statuses returned before the request was processed: the request can safely be sent again
+RETRY_STATUSES = frozenset([408, 429, 502, 503, 504])
+# Errors raised before the request reached the server
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    # Same headers as the ones honored by the openai package
+    try:
+        return float(response.headers["retry-after-ms"]) / 1000
+    except (KeyError, ValueError):
+        pass
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff(attempt: int, response: httpx.Response | None) -> float:
+    # The server knows best: its delay is always used, even if it does not fit before the deadline
+    delay = retry_after(response) if response is not None else None
+    if delay is not None and delay >= 0:
+        return delay
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class DeadlineStream(httpx.SyncByteStream):
+    """Reads a response body within the request deadline.
+
+    Each chunk read is given the read timeout capped by the time left, so a slow stream can not run past
+    the deadline even if every single chunk arrives in time.
+    """
+
+    def __init__(self,
+                 wrapped: httpx.SyncByteStream,
+                 request: httpx.Request,
+                 timeouts: dict[str, float],
+                 read_timeout: float,
+                 deadline: float,
+                 ) -> None:
+        self.wrapped = wrapped
+        self.request = request
+        self.timeouts = timeouts
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+
+    def __iter__(self) -> Iterator[bytes]:
+        chunks = iter(self.wrapped)
+        while True:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise httpx.ReadTimeout("request deadline exceeded while reading the response", request=self.request)
+            # The connection reads the timeouts from the request extensions for each chunk
+            self.timeouts["read"] = min(self.read_timeout, remaining)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            yield chunk
+
+    def close(self) -> None:
+        self.wrapped.close()
+
+
+class TracingTransport(httpx.BaseTransport):
+    """Traces each HTTP attempt, retries included, until the response headers are received."""
+
+    def __init__(self, wrapped: httpx.BaseTransport) -> None:
+        self.wrapped = wrapped
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with span("http.request", **{
+            "http.method": request.method,
+            "url.full": str(request.url),
+            "http.retry_count": request.headers.get("x-stainless-retry-count"),
+        }) as attributes:
+            response = self.wrapped.handle_request(request)
+            attributes["http.status_code"] = response.status_code
+            return response
+
+    def close(self) -> None:
+        self.wrapped.close()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Sends a request with split timeouts and retries it within an overall deadline.
+
+    Each request gets a deadline shared by all its attempts: timeouts are capped by the remaining time and
+    a retry is only attempted if its backoff delay fits in it. Only failures where the server did not
+    process the request (connection errors, 408/429/502/503/504) are retried, honoring Retry-After.
+    """
+
+    def __init__(self,
+                 wrapped: httpx.BaseTransport,
+                 max_retries: int,
+                 deadline: float,
+                 connect_timeout: float,
+                 first_token_timeout: float,
+                 read_timeout: float,
+                 ) -> None:
+        self.wrapped = wrapped
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.first_token_timeout = first_token_timeout
+        self.read_timeout = read_timeout
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            # Until the response headers are received the read timeout is the time to first token
+            timeouts = {
+                "connect": min(self.connect_timeout, remaining),
+                "read": min(self.first_token_timeout, remaining),
+                "write": min(self.read_timeout, remaining),
+                "pool": min(self.connect_timeout, remaining),
+            }
+            request.extensions["timeout"] = timeouts
+            request.headers["x-stainless-retry-count"] = str(attempt)
+            try:
+                response = self.wrapped.handle_request(request)
+            except RETRY_ERRORS:
+                if attempt >= self.max_retries:
+                    raise
+                delay = backoff(attempt, None)
+                if delay >= deadline - time.monotonic():
+                    raise
+            else:
+                retry = response.status_code in RETRY_STATUSES and attempt < self.max_retries
+                delay = backoff(attempt, response) if retry else 0.0
+                if not retry or delay >= deadline - time.monotonic():
+                    # The body is read afterwards: switch to the read timeout and keep enforcing the deadline
+                    response.stream = DeadlineStream(response.stream, request, timeouts, self.read_timeout, deadline)
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self) -> None:
+        self.wrapped.close()
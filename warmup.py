@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+from comfy_api.latest import io
+
+from .completions import cached_tokens, prepare_messages
+from .iotypes import ParamClient, ParamHistory, ParamOptions, HistoryPayload, OptionsPayload
+from .request import EMPTY_TEMPLATE, RequestTemplate
+from .tracing import span
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
+
+
+# Parameters constraining the generation: meaningless (or conflicting) for a single token prefill
+GENERATION_CONSTRAINTS = frozenset([
+    "response_format", "max_completion_tokens", "min_tokens", "ignore_eos", "stop", "stop_token_ids",
+    "guided_json", "guided_regex", "guided_choice", "guided_grammar", "guided_decoding_backend",
+    "structured_outputs",
+])
+
+
+def prefill(client: OpenAI, request: dict[str, Any]) -> tuple[float, int, int]:
+    start = time.perf_counter()
+    completion = client.chat.completions.create(**request)
+    elapsed = time.perf_counter() - start
+    prompt_tokens = completion.usage.prompt_tokens if completion.usage is not None else 0
+    return elapsed, prompt_tokens, cached_tokens(completion.usage)
+
+
+def warmup(client: OpenAI,
+           template: RequestTemplate,
+           model: str,
+           messages: list[ChatCompletionMessageParam],
+           verify: bool,
+           ) -> str:
+    # Only the prompt prefix matters: generate a single token without any output constraint
+    request = {key: value for key, value in template.build(model, messages).items()
+               if key not in GENERATION_CONSTRAINTS}
+    if "extra_body" in request:
+        request["extra_body"] = {key: value for key, value in request["extra_body"].items()
+                                 if key not in GENERATION_CONSTRAINTS}
+    request["max_tokens"] = 1
+    with span("warmup", model=model):
+        elapsed, prompt_tokens, cached = prefill(client, request)
+    report = f"Warmup: {prompt_tokens} prompt tokens in {elapsed:.2f}s"
+    if cached > 0:
+        report += f" ({cached} were already cached)"
+    # Estimate the saving from this single request: the uncached tokens were prefilled in the measured time
+    # and the next requests sharing the prefix get all of them from the cache
+    computed = prompt_tokens - cached
+    if computed > 0:
+        report += f", ~{elapsed * prompt_tokens / computed:.2f}s of prefill saved per request once cached"
+    elif prompt_tokens > 0:
+        report += ", the prefix cache was already hot"
+    if verify:
+        # Send the same prefix again to check the server actually reports the cached tokens
+        with span("warmup.verify", model=model):
+            hot_elapsed, _, hot_cached = prefill(client, request)
+        if hot_cached > 0:
+            report += f"\nPrefix cache hit: {hot_cached} cached tokens, request took {hot_elapsed:.2f}s"
+        else:
+            report += f"\nNo cached tokens reported by the server (prefix caching disabled or not reported), " \
+                      f"request took {hot_elapsed:.2f}s"
+    return report
+
+
+class PrefixWarmup(io.ComfyNode):
+    @classmethod
+    def define_schema(cls) -> io.Schema:
+        return io.Schema(
+            node_id="OAIAPI_PrefixWarmup",
+            display_name="OpenAI API - Prefix Cache Warmup",
+            category="OpenAI API",
+            description="Sends the shared system prompt and history with a single token generation so the server prefix cache (vLLM automatic prefix caching for example) is hot when the chat completion nodes using the same prefix run. Chain the chat completions on the forwarded client to run them after the warmup.",
+            inputs=[
+                ParamClient.Input(
+                    id="client",
+                    display_name="API Client",
+                    tooltip="The OpenAI API client to use to perform the request"
+                ),
+                io.String.Input(
+                    id="model",
+                    display_name="Model",
+                    tooltip="The model the chat completions will use",
+                    placeholder="Model name",
+                ),
+                io.Boolean.Input(
+                    id="background",
+                    display_name="Background",
+                    tooltip="Send the warmup in the background and forward the client right away, the report is then printed to the console",
+                    default=False,
+                ),
+                io.Boolean.Input(
+                    id="verify",
+                    display_name="Verify",
+                    tooltip="Send the prefix a second time to check the server reports the cached tokens",
+                    default=False,
+                ),
+                io.Boolean.Input(
+                    id="force_rerun",
+                    display_name="Force Rerun",
+                    tooltip="Set to true to send the warmup on every queue even if no widget input values have changed, the server cache may have been evicted since the last run",
+                    default=False,
+                ),
+                io.String.Input(
+                    id="system_prompt",
+                    display_name="System Prompt",
+                    optional=True,
+                    tooltip="The system prompt shared by the chat completions",
+                    multiline=True,
+                    placeholder="system/developer prompt",
+                ),
+                ParamHistory.Input(
+                    id="history",
+                    display_name="History",
+                    optional=True,
+                    tooltip="The conversation history (few-shot examples for example) shared by the chat completions",
+                ),
+                ParamOptions.Input(
+                    id="options",
+                    display_name="Options",
+                    optional=True,
+                    tooltip="The options used by the chat completions (developer role, extra body, etc...)",
+                ),
+            ],
+            outputs=[
+                ParamClient.Output(
+                    id="client",
+                    display_name="API Client",
+                    tooltip="The same client, forwarded once the warmup is done (or started in background mode)",
+                ),
+                io.String.Output(
+                    id="report",
+                    display_name="Report",
+                    tooltip="Prefill time and cached tokens reported by the server",
+                ),
+            ],
+        )
+
+    @classmethod
+    def validate_inputs(cls, model: str) -> bool | str:
+        if model == "":
+            return "model must be specified"
+        return True
+
+    @classmethod
+    def fingerprint_inputs(cls, **kwargs) -> str:
+        if kwargs.get("force_rerun"):
+            return str(time.time())  # Use timestamp for always refresh
+        else:
+            # Not fingerprinting on time: the chat completions chained on the forwarded client would rerun too
+            kwargs.pop("force_rerun", None)
+            return json.dumps(kwargs, sort_keys=True, separators=(',', ':'))
+
+    @classmethod
+    def execute(cls,
+                client: OpenAI,
+                model: str,
+                background: bool,
+                verify: bool,
+                system_prompt: str | None = None,
+                history: HistoryPayload | None = None,
+                options: OptionsPayload | None = None,
+                force_rerun: bool = False,
+                ) -> io.NodeOutput:
+        template = options.get_template() if options is not None else EMPTY_TEMPLATE
+        messages = prepare_messages(system_prompt, history, template.use_developer_role)
+        if not messages:
+            raise ValueError("a system prompt or a history is needed to warm up the prefix cache")
+        # Most chat templates expect a user turn to generate, the shared prefix stays the same
+        messages.append({
+            "role": "user",
+            "content": ".",
+        })
+        if background:
+            def run() -> None:
+                try:
+                    print(warmup(client, template, model, messages, verify))
+                except Exception as e:
+                    print(f"Warmup failed: {e}")
+            threading.Thread(target=run, name="oaiapi-warmup", daemon=True).start()
+            report = "Warmup started in background"
+        else:
+            report = warmup(client, template, model, messages, verify)
+            print(report)
+        return io.NodeOutput(client, report)